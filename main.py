@@ -4,20 +4,57 @@ AstrBot 时间进度卡片插件
 """
 
 import os
+import asyncio
 import tempfile
 import calendar
 import base64
+import hashlib
+import html
+import json
+import math
+import mmap
+import time
+from collections import deque
 from datetime import datetime
 from zoneinfo import ZoneInfo
+from aiohttp import web
 from playwright.async_api import async_playwright
 from astrbot.api.event import filter, AstrMessageEvent
-from astrbot.api.star import Context, Star, register
+from astrbot.api.star import Context, Star, StarTools, register
 from astrbot.api import logger
 
 # 获取插件目录路径
 PLUGIN_DIR = os.path.dirname(os.path.abspath(__file__))
 FONT_PATH = os.path.join(PLUGIN_DIR, "fonts", "LXGWWenKai-Regular.ttf")
 
+# 卡片模板版本，修改 HTML 模板后需递增以使磁盘缓存失效
+TEMPLATE_VERSION = "2"
+
+# 卡片版式: (宽, 高, 原始缩放倍数)
+CARD_LAYOUTS = {
+    "time_card": (420, 240, 2),
+    "year_matrix": (400, 480, 3),
+}
+
+# 磁盘缓存清理间隔(秒)
+CACHE_EVICT_INTERVAL = 300
+
+# HTTP 渲染服务支持的卡片类型
+CARD_TYPES = ("time", "week", "month", "year", "year_matrix", "countdown")
+
+# 倒计时名称和 HTTP 卡片标题的最大长度
+MAX_TITLE_LENGTH = 20
+
+# 倒计时预渲染的最长休眠时间(秒)
+COUNTDOWN_MAX_SLEEP = 3600
+
+# 渲染质量档位：0 为原始质量，数值越大越快、清晰度越低
+MAX_QUALITY_TIER = 2
+# 估算渲染延迟时只统计该时间窗口(秒)内的渲染，空闲时旧样本过期，档位得以恢复
+LATENCY_WINDOW = 60
+# 两次调整质量档位之间的最短间隔(秒)，避免一次突发请求连续降级
+QUALITY_STEP_INTERVAL = 10
+
 
 @register(
     "astrbot_plugin_timeprogress",
@@ -32,14 +69,35 @@ class TimeProgressPlugin(Star):
     def __init__(self, context: Context):
         super().__init__(context)
         self._font_base64_cache = None
+        self._playwright = None
+        self._browser = None
+        self._browser_lock = asyncio.Lock()
+        self._render_semaphore = None
+        self._pending_renders = 0
+        self._render_latencies = deque()
+        self._quality_tier = 0
+        self._quality_changed_at = None
+        self._http_runner = None
+        self._font_version = None
+        self._data_dir = str(StarTools.get_data_dir("astrbot_plugin_timeprogress"))
+        cache_dir = str(self.context.get_config().get("disk_cache_dir", "") or "").strip()
+        self._cache_dir = os.path.expanduser(cache_dir) if cache_dir else os.path.join(self._data_dir, "card_cache")
+        self._cache_evict_task = None
+        self._countdowns_path = os.path.join(self._data_dir, "countdowns.json")
+        self._countdowns = self._load_countdowns()
+        self._countdowns_changed = asyncio.Event()
+        self._countdown_task = None
         logger.info("时间进度卡片插件已加载")
 
-    def _get_current_time(self):
-        """获取当前时间，支持配置的时区"""
+    def _get_current_time(self, now: datetime = None):
+        """获取当前时间，支持配置的时区；传入 now 时直接使用该时间"""
         config = self.context.get_config()
         timezone_str = config.get("timezone", "Asia/Shanghai")
         debug_time = config.get("debug_time", False)
 
+        if now is not None:
+            return now, debug_time
+
         try:
             tz = ZoneInfo(timezone_str)
             now = datetime.now(tz)
@@ -69,14 +127,19 @@ class TimeProgressPlugin(Star):
         except (ValueError, AttributeError):
             return None
 
-    def calculate_time_data(self, start_time: str = None, end_time: str = None) -> dict:
+    def calculate_time_data(self, start_time: str = None, end_time: str = None, now: datetime = None) -> dict:
         """
         计算今天的时间数据
 
+        Args:
+            start_time: 自定义开始时间 HH:MM
+            end_time: 自定义结束时间 HH:MM
+            now: 指定计算使用的时间，默认为当前时间
+
         Returns:
             包含时间数据的字典
         """
-        now, debug_time = self._get_current_time()
+        now, debug_time = self._get_current_time(now)
 
         # 输出调试信息
         if debug_time:
@@ -116,7 +179,8 @@ class TimeProgressPlugin(Star):
                     total_hours = end_hours - start_hours
                     elapsed_hours = max(0, min(current_hours - start_hours, total_hours))
 
-                percentage = (elapsed_hours / total_hours) * 100 if total_hours > 0 else 0
+                # 百分比保留到显示精度，显示相同的卡片数据一致，便于缓存复用
+                percentage = round((elapsed_hours / total_hours) * 100, 1) if total_hours > 0 else 0
 
                 return {
                     "title": f"{start_time}-{end_time}",
@@ -131,7 +195,7 @@ class TimeProgressPlugin(Star):
         minutes = now.minute
         current_value = hours + (minutes / 60)
         total_value = 24
-        percentage = (current_value / total_value) * 100
+        percentage = round((current_value / total_value) * 100, 1)
 
         return {
             "title": "今天",
@@ -141,14 +205,14 @@ class TimeProgressPlugin(Star):
             "percentage": percentage
         }
 
-    def calculate_month_data(self) -> dict:
+    def calculate_month_data(self, now: datetime = None) -> dict:
         """计算本月的时间数据"""
-        now, debug_time = self._get_current_time()
+        now, debug_time = self._get_current_time(now)
 
         total_days = calendar.monthrange(now.year, now.month)[1]
         hours_today = now.hour + (now.minute / 60)
         current_value = (now.day - 1) + (hours_today / 24)
-        percentage = (current_value / total_days) * 100
+        percentage = round((current_value / total_days) * 100, 1)
 
         if debug_time:
             logger.info(f"[时间调试] 本月: {now.day}/{total_days}天, 进度{percentage:.1f}%")
@@ -161,15 +225,15 @@ class TimeProgressPlugin(Star):
             "percentage": percentage
         }
 
-    def calculate_week_data(self) -> dict:
+    def calculate_week_data(self, now: datetime = None) -> dict:
         """计算本周的时间数据"""
-        now, debug_time = self._get_current_time()
+        now, debug_time = self._get_current_time(now)
 
         weekday = now.weekday()
         current_day = weekday + 1
         hours_today = now.hour + (now.minute / 60)
         current_value = (current_day - 1) + (hours_today / 24)
-        percentage = (current_value / 7) * 100
+        percentage = round((current_value / 7) * 100, 1)
 
         if debug_time:
             logger.info(f"[时间调试] 本周: 第{current_day}天/7天, 进度{percentage:.1f}%")
@@ -182,15 +246,15 @@ class TimeProgressPlugin(Star):
             "percentage": percentage
         }
 
-    def calculate_year_data(self) -> dict:
+    def calculate_year_data(self, now: datetime = None) -> dict:
         """计算本年的时间数据"""
-        now, debug_time = self._get_current_time()
+        now, debug_time = self._get_current_time(now)
 
         total_days = 366 if calendar.isleap(now.year) else 365
         day_of_year = now.timetuple().tm_yday
         hours_today = now.hour + (now.minute / 60)
         current_value = (day_of_year - 1) + (hours_today / 24)
-        percentage = (current_value / total_days) * 100
+        percentage = round((current_value / total_days) * 100, 1)
 
         if debug_time:
             logger.info(f"[时间调试] 本年: 第{day_of_year}天/{total_days}天, 进度{percentage:.1f}%")
@@ -206,13 +270,104 @@ class TimeProgressPlugin(Star):
             "total_days": total_days
         }
 
+    def parse_datetime_string(self, datetime_str: str):
+        """
+        解析 ISO 格式的日期或日期时间字符串
+
+        未指定时区时按配置的时区解释，只有日期时视为当天 00:00。
+
+        Returns:
+            带时区的 datetime，格式错误时返回 None
+        """
+        try:
+            parsed = datetime.fromisoformat(datetime_str.strip())
+        except (ValueError, AttributeError):
+            return None
+        if parsed.tzinfo is None:
+            now, _ = self._get_current_time()
+            parsed = parsed.replace(tzinfo=now.tzinfo) if now.tzinfo else parsed.astimezone()
+        return parsed
+
+    def calculate_period_batch(self, periods: list, now: datetime = None) -> list:
+        """
+        批量计算任意时间段的进度，所有时间段共用同一次时钟读数
+
+        时间段按时间戳计算，跨夏令时切换的时间段长度按实际经过的时间计。
+        显示的百分比和当前值都保留一位小数，据此推算每个时间段显示数值下次变化的时刻。
+
+        Args:
+            periods: (标题, 开始时间, 结束时间) 列表，时间为带时区的 datetime
+            now: 指定计算使用的时间，默认为当前时间
+
+        Returns:
+            (时间数据字典, 下次变化时间) 列表，时间段已结束时下次变化时间为 None
+        """
+        now, debug_time = self._get_current_time(now)
+        now_ts = now.timestamp()
+
+        titles = [title for title, _, _ in periods]
+        starts = [start.timestamp() for _, start, _ in periods]
+        ends = [end.timestamp() for _, _, end in periods]
+        totals = [max(end - start, 0) for start, end in zip(starts, ends)]
+        elapsed = [min(max(now_ts - start, 0), total) for start, total in zip(starts, totals)]
+        # 不足两天的时间段以小时为单位显示，否则以天为单位
+        units = [3600 if total < 2 * 86400 else 86400 for total in totals]
+        percentages = [
+            round(e / total * 100, 1) if total > 0 else 0
+            for e, total in zip(elapsed, totals)
+        ]
+        # 百分比每变化 0.1%、当前值每变化 0.1 个单位，显示的数值才会改变
+        steps = [
+            [total / 1000, unit / 10] if total > 0 else []
+            for total, unit in zip(totals, units)
+        ]
+
+        results = []
+        for i, title in enumerate(titles):
+            unit_name = "小时" if units[i] == 3600 else "天"
+            data = {
+                "title": title,
+                "current": f"{elapsed[i] / units[i]:.1f}",
+                "total": f"{totals[i] / units[i]:.1f}",
+                "unit": unit_name,
+                "percentage": percentages[i],
+            }
+
+            if now_ts >= ends[i] or not steps[i]:
+                next_change = None
+            else:
+                # 一位小数四舍五入，进位点位于两个显示值的中间
+                next_ts = min(
+                    starts[i] + (math.floor(elapsed[i] / step + 0.5) + 0.5) * step
+                    for step in steps[i]
+                )
+                next_ts = max(next_ts, now_ts)
+                if next_ts < ends[i]:
+                    next_change = datetime.fromtimestamp(next_ts, now.tzinfo)
+                elif (data["percentage"], data["current"]) != (100.0, data["total"]):
+                    # 结束前不再进位，但结束时会跳到 100% 和总长
+                    next_change = datetime.fromtimestamp(ends[i], now.tzinfo)
+                else:
+                    # 已显示结束时的数值，之后不再变化
+                    next_change = None
+            results.append((data, next_change))
+
+            if debug_time:
+                logger.info(f"[时间调试] {title}: {data['current']}/{data['total']}{unit_name}, "
+                            f"进度{percentages[i]:.1f}%, 下次变化 {next_change}")
+
+        return results
+
     def _get_font_base64(self) -> str:
-        """读取本地字体文件并转换为 base64"""
+        """读取本地字体文件并转换为 base64，结果会被缓存"""
+        if self._font_base64_cache is not None:
+            return self._font_base64_cache
         try:
             if os.path.exists(FONT_PATH):
                 with open(FONT_PATH, 'rb') as f:
                     font_data = f.read()
-                return base64.b64encode(font_data).decode('utf-8')
+                self._font_base64_cache = base64.b64encode(font_data).decode('utf-8')
+                return self._font_base64_cache
             else:
                 logger.warning(f"字体文件不存在: {FONT_PATH}")
                 return None
@@ -220,41 +375,362 @@ class TimeProgressPlugin(Star):
             logger.error(f"读取字体文件失败: {e}")
             return None
 
-    async def _render_html_to_image(self, html_content: str, width: int, height: int, scale_factor: int = 2) -> str:
-        """通用 Playwright 渲染方法"""
+    async def _get_browser(self):
+        """获取共享浏览器实例，配置了 CDP 地址时连接外部浏览器，连接断开后自动重连"""
+        async with self._browser_lock:
+            if self._browser is not None and self._browser.is_connected():
+                return self._browser
+
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+
+            config = self.context.get_config()
+            endpoint = (config.get("browser_endpoint", "") or "").strip()
+            if endpoint:
+                logger.info(f"连接外部浏览器: {endpoint}")
+                self._browser = await self._playwright.chromium.connect_over_cdp(endpoint)
+            else:
+                logger.info("启动本地 Chromium 浏览器")
+                self._browser = await self._playwright.chromium.launch(headless=True)
+            return self._browser
+
+    async def _close_browser(self):
+        """关闭浏览器连接并停止 Playwright"""
+        async with self._browser_lock:
+            if self._browser is not None:
+                try:
+                    await self._browser.close()
+                except Exception as e:
+                    logger.warning(f"关闭浏览器失败: {e}")
+                self._browser = None
+            if self._playwright is not None:
+                try:
+                    await self._playwright.stop()
+                except Exception as e:
+                    logger.warning(f"停止 Playwright 失败: {e}")
+                self._playwright = None
+
+    def _get_render_semaphore(self) -> asyncio.Semaphore:
+        """获取渲染并发限制信号量，聊天指令与 HTTP 服务共用"""
+        if self._render_semaphore is None:
+            config = self.context.get_config()
+            limit = max(1, int(config.get("max_concurrent_renders", 2)))
+            self._render_semaphore = asyncio.Semaphore(limit)
+        return self._render_semaphore
+
+    def _select_quality_tier(self) -> int:
+        """根据排队渲染数和最近一段时间的渲染延迟逐级调整质量档位，每次调整间隔不少于 QUALITY_STEP_INTERVAL 秒"""
+        config = self.context.get_config()
+        if not config.get("adaptive_quality", True):
+            self._quality_tier = 0
+            return 0
+
+        max_tier = max(0, min(int(config.get("adaptive_max_tier", MAX_QUALITY_TIER)), MAX_QUALITY_TIER))
+        queue_threshold = max(1, int(config.get("adaptive_queue_threshold", 2)))
+        latency_threshold = int(config.get("adaptive_latency_threshold_ms", 2000)) / 1000
+
+        now = time.monotonic()
+        while self._render_latencies and now - self._render_latencies[0][0] > LATENCY_WINDOW:
+            self._render_latencies.popleft()
+        avg_latency = (
+            sum(latency for _, latency in self._render_latencies) / len(self._render_latencies)
+            if self._render_latencies else 0
+        )
+        overloaded = self._pending_renders > queue_threshold or avg_latency > latency_threshold
+        relaxed = self._pending_renders <= 1 and avg_latency < latency_threshold / 2
+        can_step = (
+            self._quality_changed_at is None
+            or now - self._quality_changed_at >= QUALITY_STEP_INTERVAL
+        )
+
+        if can_step and overloaded and self._quality_tier < max_tier:
+            self._quality_tier += 1
+            self._quality_changed_at = now
+            logger.info(
+                f"渲染负载较高(排队 {self._pending_renders}, 平均延迟 {avg_latency:.2f}s)，"
+                f"降低质量至档位 {self._quality_tier}"
+            )
+        elif can_step and relaxed and self._quality_tier > 0:
+            self._quality_tier -= 1
+            self._quality_changed_at = now
+            logger.info(f"渲染负载下降，恢复质量至档位 {self._quality_tier}")
+
+        self._quality_tier = min(self._quality_tier, max_tier)
+        return self._quality_tier
+
+    def _get_quality_profile(self, tier: int, base_scale: int) -> dict:
+        """
+        获取质量档位对应的渲染参数
+
+        Args:
+            tier: 质量档位
+            base_scale: 卡片的原始缩放倍数
+
+        Returns:
+            包含 tier、scale、format、wait 的字典
+        """
+        config = self.context.get_config()
+        min_scale = max(1, min(int(config.get("min_scale_factor", 1)), base_scale))
+
+        if tier <= 0:
+            return {"tier": 0, "scale": base_scale, "format": "png", "wait": "timeout"}
+        if tier == 1:
+            return {"tier": 1, "scale": max(min_scale, base_scale - 1), "format": "png", "wait": "fonts"}
+        return {"tier": 2, "scale": min_scale, "format": "jpeg", "wait": "fonts"}
+
+    async def _render_html_to_bytes(self, html_content: str, width: int, height: int, quality: dict,
+                                    track_load: bool = True) -> bytes:
+        """
+        通用 Playwright 渲染方法，每次渲染使用独立的浏览器上下文
+
+        track_load 为 False 时不计入排队数和渲染延迟，不影响自适应质量档位
+        """
+        if not track_load:
+            async with self._get_render_semaphore():
+                return await self._screenshot_html(html_content, width, height, quality)
+
+        self._pending_renders += 1
         try:
-            async with async_playwright() as p:
-                browser = await p.chromium.launch(headless=True)
-                page = await browser.new_page(
+            async with self._get_render_semaphore():
+                started = time.monotonic()
+                image_bytes = await self._screenshot_html(html_content, width, height, quality)
+                finished = time.monotonic()
+                self._render_latencies.append((finished, finished - started))
+        finally:
+            self._pending_renders -= 1
+        return image_bytes
+
+    async def _screenshot_html(self, html_content: str, width: int, height: int, quality: dict) -> bytes:
+        """在独立浏览器上下文中加载 HTML 并截图，连接断开时重连重试一次"""
+        for attempt in range(2):
+            browser = await self._get_browser()
+            try:
+                context = await browser.new_context(
                     viewport={'width': width, 'height': height},
-                    device_scale_factor=scale_factor
+                    device_scale_factor=quality['scale']
                 )
-                await page.set_content(html_content)
-                await page.wait_for_timeout(500)
-                
-                temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
-                await page.screenshot(
-                    path=temp_file.name,
-                    full_page=False,
-                    type='png',
-                    omit_background=False
+                try:
+                    page = await context.new_page()
+                    await page.set_content(html_content)
+                    if quality['wait'] == "fonts":
+                        await page.evaluate("document.fonts.ready.then(() => true)")
+                    else:
+                        await page.wait_for_timeout(500)
+
+                    if quality['format'] == "jpeg":
+                        return await page.screenshot(full_page=False, type='jpeg', quality=85)
+                    return await page.screenshot(
+                        full_page=False,
+                        type='png',
+                        omit_background=False
+                    )
+                finally:
+                    try:
+                        await context.close()
+                    except Exception:
+                        pass
+            except Exception as e:
+                # 外部浏览器重启或连接中断时重连后重试一次
+                if attempt == 0 and not browser.is_connected():
+                    logger.warning(f"浏览器连接已断开，正在重连: {e}")
+                    continue
+                logger.error(f"Playwright 渲染失败: {e}")
+                raise
+
+    def _get_font_version(self) -> str:
+        """字体文件的版本标识，用于磁盘缓存键"""
+        if self._font_version is None:
+            try:
+                stat = os.stat(FONT_PATH)
+                self._font_version = f"{stat.st_size}-{stat.st_mtime_ns}"
+            except OSError:
+                self._font_version = "system"
+        return self._font_version
+
+    def _card_cache_path(self, layout: str, data: dict, quality: dict) -> str:
+        """按模板版本、字体版本、缩放倍数、格式和卡片数据计算缓存文件路径"""
+        key_source = json.dumps(
+            {
+                "template": TEMPLATE_VERSION,
+                "font": self._get_font_version(),
+                "layout": layout,
+                "scale": quality['scale'],
+                "format": quality['format'],
+                "data": data,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        digest = hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+        ext = "jpg" if quality['format'] == "jpeg" else "png"
+        return os.path.join(self._cache_dir, f"{digest}.{ext}")
+
+    def _read_cached_image(self, path: str):
+        """
+        通过内存映射读取缓存图片，不存在时返回 None
+
+        返回基于映射的 memoryview，不复制文件内容；映射在 memoryview 不再被引用
+        （图片发送或响应写出）后释放，期间文件被淘汰或替换不影响已映射的内容。
+        """
+        try:
+            with open(path, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            # 更新修改时间，清理时按最近使用顺序淘汰
+            os.utime(path)
+            return memoryview(mm)
+        except (FileNotFoundError, ValueError):
+            return None
+        except OSError as e:
+            logger.warning(f"读取卡片缓存失败: {e}")
+            return None
+
+    def _write_cached_image(self, path: str, image_bytes: bytes):
+        """原子写入缓存图片，其他进程不会读到写了一半的文件"""
+        try:
+            os.makedirs(self._cache_dir, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self._cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(image_bytes)
+                os.replace(temp_path, path)
+            except Exception:
+                os.unlink(temp_path)
+                raise
+        except OSError as e:
+            logger.warning(f"写入卡片缓存失败: {e}")
+
+    def _evict_disk_cache(self):
+        """按最近使用时间淘汰缓存文件，使总大小不超过配置上限"""
+        config = self.context.get_config()
+        max_bytes = int(config.get("disk_cache_max_mb", 64)) * 1024 * 1024
+
+        entries = []
+        total_size = 0
+        now = time.time()
+        with os.scandir(self._cache_dir) as it:
+            for entry in it:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                # 清理异常退出遗留的临时文件
+                if entry.name.endswith('.tmp'):
+                    if now - stat.st_mtime > CACHE_EVICT_INTERVAL:
+                        try:
+                            os.unlink(entry.path)
+                        except FileNotFoundError:
+                            pass
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+
+        if total_size <= max_bytes:
+            return
+
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total_size <= max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # Windows 下仍被映射的文件无法删除，留到下次清理
+                continue
+            total_size -= size
+            removed += 1
+        logger.info(f"已清理 {removed} 个卡片缓存文件")
+
+    async def _disk_cache_evict_loop(self):
+        """后台定期清理磁盘缓存"""
+        while True:
+            try:
+                if os.path.isdir(self._cache_dir):
+                    await asyncio.to_thread(self._evict_disk_cache)
+            except Exception as e:
+                logger.warning(f"清理卡片缓存失败: {e}")
+            await asyncio.sleep(CACHE_EVICT_INTERVAL)
+
+    async def _render_card(self, layout: str, data: dict, fresh: bool = False, track_load: bool = True):
+        """
+        渲染卡片，优先使用磁盘缓存中已渲染的图片
+
+        Args:
+            layout: 卡片版式，取值见 CARD_LAYOUTS
+            data: 时间数据字典
+            fresh: 为 True 时跳过缓存并固定使用原始质量，且不计入渲染负载，用于基准图回归测试
+            track_load: 为 False 时沿用当前质量档位且不计入渲染负载，仍读写磁盘缓存，用于后台预渲染
+
+        Returns:
+            (图片数据, 质量参数字典)，命中缓存时图片数据为内存映射的 memoryview
+        """
+        width, height, base_scale = CARD_LAYOUTS[layout]
+        config = self.context.get_config()
+        if fresh:
+            tier = 0
+            use_cache = False
+            track_load = False
+        else:
+            if track_load:
+                tier = self._select_quality_tier()
+            else:
+                tier = self._quality_tier if config.get("adaptive_quality", True) else 0
+            use_cache = config.get("disk_cache_enabled", True)
+
+        if use_cache:
+            # 已有更高质量的缓存时直接使用
+            for cached_tier in range(tier + 1):
+                quality = self._get_quality_profile(cached_tier, base_scale)
+                image_bytes = await asyncio.to_thread(
+                    self._read_cached_image, self._card_cache_path(layout, data, quality)
                 )
-                await browser.close()
-                return temp_file.name
-        except Exception as e:
-            logger.error(f"Playwright 渲染失败: {e}")
-            raise
+                if image_bytes is not None:
+                    logger.info(f"命中卡片磁盘缓存，质量档位 {quality['tier']}")
+                    return image_bytes, quality
 
-    async def draw_time_card(self, data: dict) -> str:
+        quality = self._get_quality_profile(tier, base_scale)
+        if layout == "year_matrix":
+            html_template = self._build_year_matrix_html(data)
+        else:
+            html_template = self._build_time_card_html(data)
+        image_bytes = await self._render_html_to_bytes(
+            html_template, width, height, quality, track_load=track_load
+        )
+
+        if use_cache:
+            await asyncio.to_thread(
+                self._write_cached_image, self._card_cache_path(layout, data, quality), image_bytes
+            )
+
+        logger.info(
+            f"渲染质量档位 {quality['tier']}: scale={quality['scale']}, "
+            f"format={quality['format']}, wait={quality['wait']}"
+        )
+        return image_bytes, quality
+
+    def _write_temp_image(self, image_bytes: bytes, quality: dict) -> str:
+        """将图片数据写入临时文件，返回文件路径"""
+        suffix = '.jpg' if quality['format'] == "jpeg" else '.png'
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
+            temp_file.write(image_bytes)
+        return temp_file.name
+
+    def _build_time_card_html(self, data: dict) -> str:
         """
-        使用 Playwright 异步渲染 HTML 生成高清时间卡片图片
+        构建进度条样式时间卡片的 HTML
 
         Args:
             data: 时间数据字典
 
         Returns:
-            图片文件路径
+            HTML 字符串
         """
+        # 标题可能来自用户输入(倒计时名称、HTTP title 参数)，插入 HTML 前必须转义
+        title = html.escape(str(data['title']))
+        details = html.escape(f"{data['current']}/{data['total']} {data['unit']}")
+        percentage = float(data['percentage'])
+
         # 获取字体 base64
         font_base64 = self._get_font_base64()
 
@@ -306,6 +782,7 @@ class TimeProgressPlugin(Star):
             align-items: center;
             width: 420px;
             height: 240px;
+            overflow: hidden;
         }}
 
         .card {{
@@ -344,7 +821,7 @@ class TimeProgressPlugin(Star):
             background: #27272a;
             border-radius: 8px;
             transition: width 1s ease-out;
-            width: {data['percentage']}%;
+            width: {percentage}%;
         }}
 
         .stats {{
@@ -373,22 +850,35 @@ class TimeProgressPlugin(Star):
 </head>
 <body>
     <div class="card">
-        <div class="title">{data['title']}</div>
+        <div class="title">{title}</div>
         <div class="progress-container">
             <div class="progress-fill"></div>
         </div>
         <div class="stats">
-            <div class="percentage">{data['percentage']:.1f}%</div>
-            <div class="details">{data['current']}/{data['total']} {data['unit']}</div>
+            <div class="percentage">{percentage:.1f}%</div>
+            <div class="details">{details}</div>
         </div>
     </div>
 </body>
 </html>
         '''
 
+        return html_template
+
+    async def draw_time_card(self, data: dict) -> str:
+        """
+        使用 Playwright 异步渲染 HTML 生成高清时间卡片图片
+
+        Args:
+            data: 时间数据字典
+
+        Returns:
+            图片文件路径
+        """
         try:
             logger.info("使用 Playwright 异步渲染时间卡片...")
-            temp_file_name = await self._render_html_to_image(html_template, 420, 240, 2)
+            image_bytes, quality = await self._render_card("time_card", data)
+            temp_file_name = self._write_temp_image(image_bytes, quality)
             logger.info(f"✅ 成功生成高清时间卡片: {temp_file_name} (Playwright异步渲染)")
             return temp_file_name
 
@@ -397,20 +887,20 @@ class TimeProgressPlugin(Star):
             logger.error("请确保已安装 Playwright: pip install playwright && playwright install chromium")
             raise
 
-    async def draw_year_matrix_card(self, data: dict) -> str:
+    def _build_year_matrix_html(self, data: dict) -> str:
         """
-        使用点阵矩阵样式渲染年度进度卡片
+        构建点阵矩阵样式年度卡片的 HTML
 
         Args:
             data: 年度数据字典
 
         Returns:
-            图片文件路径
+            HTML 字符串
         """
-        year = data['year']
-        day_of_year = data['day_of_year']
-        total_days = data['total_days']
-        percentage = data['percentage']
+        year = int(data['year'])
+        day_of_year = int(data['day_of_year'])
+        total_days = int(data['total_days'])
+        percentage = float(data['percentage'])
 
         # 生成点阵 HTML
         dots_html = ""
@@ -465,6 +955,7 @@ class TimeProgressPlugin(Star):
             width: 400px;
             height: 480px;
             padding: 0;
+            overflow: hidden;
         }}
 
         .card {{
@@ -599,9 +1090,22 @@ class TimeProgressPlugin(Star):
 </html>
         '''
 
+        return html_template
+
+    async def draw_year_matrix_card(self, data: dict) -> str:
+        """
+        使用点阵矩阵样式渲染年度进度卡片
+
+        Args:
+            data: 年度数据字典
+
+        Returns:
+            图片文件路径
+        """
         try:
             logger.info("使用 Playwright 渲染点阵矩阵年度卡片...")
-            temp_file_name = await self._render_html_to_image(html_template, 400, 480, 3)
+            image_bytes, quality = await self._render_card("year_matrix", data)
+            temp_file_name = self._write_temp_image(image_bytes, quality)
             logger.info(f"✅ 成功生成点阵矩阵年度卡片: {temp_file_name}")
             return temp_file_name
 
@@ -630,6 +1134,221 @@ class TimeProgressPlugin(Star):
             logger.error(f"生成时间卡片图片失败: {e}")
             raise
 
+    def get_card_data(self, card_type: str, start_time: str = None, end_time: str = None,
+                      now: datetime = None) -> dict:
+        """
+        按卡片类型计算时间数据
+
+        Args:
+            card_type: 卡片类型，取值见 CARD_TYPES
+            start_time: 自定义开始时间 HH:MM，仅 time 类型有效
+            end_time: 自定义结束时间 HH:MM，仅 time 类型有效
+            now: 指定计算使用的时间，默认为当前时间
+
+        Returns:
+            时间数据字典
+        """
+        if card_type == "time":
+            if start_time or end_time:
+                if not (self.parse_time_string(start_time or "") and self.parse_time_string(end_time or "")):
+                    raise ValueError("时间格式错误，请使用 HH:MM 格式")
+            return self.calculate_time_data(start_time, end_time, now)
+        if card_type == "week":
+            return self.calculate_week_data(now)
+        if card_type == "month":
+            return self.calculate_month_data(now)
+        if card_type in ("year", "year_matrix"):
+            return self.calculate_year_data(now)
+        raise ValueError(f"未知的卡片类型: {card_type}")
+
+    async def render_card_bytes(self, card_type: str, data: dict):
+        """
+        渲染指定类型的卡片并返回图片数据
+
+        Args:
+            card_type: 卡片类型，取值见 CARD_TYPES
+            data: 时间数据字典
+
+        Returns:
+            (图片数据, 质量参数字典)，图片数据为 bytes 或内存映射的 memoryview
+        """
+        layout = "year_matrix" if card_type == "year_matrix" else "time_card"
+        return await self._render_card(layout, data)
+
+    def _next_rounded_change(self, elapsed: float, step: float) -> float:
+        """
+        按一位小数四舍五入显示的数值，返回显示值下次改变时的 elapsed
+
+        Args:
+            elapsed: 当前已经过的量
+            step: 显示值变化 0.1 所对应的 elapsed 增量
+        """
+        position = elapsed / step + 0.5
+        if abs(position - round(position)) < 1e-9:
+            # 恰好位于进位点时舍入方向取决于浮点误差，视为随时可能变化
+            return elapsed
+        return (math.floor(position) + 0.5) * step
+
+    def _next_change_minute(self, elapsed: int, step: float) -> int:
+        """按整分钟计算的数值，返回显示值下次可能改变的分钟"""
+        return max(elapsed + 1, math.ceil(self._next_rounded_change(elapsed, step)))
+
+    def _minutes_until_time_card_change(self, minute_of_day: int, start_time: str = None,
+                                        end_time: str = None) -> int:
+        """计算今天卡片的显示数值在多少分钟后改变，算法与 calculate_time_data 对应"""
+        start_parsed = self.parse_time_string(start_time) if start_time and end_time else None
+        end_parsed = self.parse_time_string(end_time) if start_parsed else None
+
+        if not end_parsed:
+            # 默认卡片：百分比每 1.44 分钟变化 0.1%，当前值为整点小时数
+            percentage_change = self._next_change_minute(minute_of_day, 1440 / 1000)
+            return min(percentage_change - minute_of_day, 60 - minute_of_day % 60)
+
+        start = start_parsed[0] * 60 + start_parsed[1]
+        end = end_parsed[0] * 60 + end_parsed[1]
+        if end < start:
+            total = (1440 - start) + end
+            in_window = minute_of_day >= start or minute_of_day < end
+            elapsed = minute_of_day - start if minute_of_day >= start else (1440 - start) + minute_of_day
+        else:
+            total = end - start
+            in_window = start <= minute_of_day < end
+            elapsed = minute_of_day - start
+
+        if not in_window or total <= 0:
+            # 时间段外数值保持不变，直到下一次开始或午夜重置
+            return min((start - minute_of_day) % 1440 or 1440, 1440 - minute_of_day)
+
+        # 百分比每 total/1000 分钟变化 0.1%，已过小时数每 6 分钟变化 0.1
+        next_elapsed = min(
+            self._next_change_minute(elapsed, total / 1000),
+            self._next_change_minute(elapsed, 6),
+            total,
+        )
+        return next_elapsed - elapsed
+
+    def _minutes_until_day_card_change(self, day_index: int, total_days: int, minute_of_day: int) -> int:
+        """计算本周/本月/本年卡片的显示数值在多少分钟后改变，当前值在午夜改变"""
+        elapsed = (day_index - 1) * 1440 + minute_of_day
+        percentage_change = self._next_change_minute(elapsed, total_days * 1440 / 1000)
+        return min(percentage_change - elapsed, 1440 - minute_of_day)
+
+    def _seconds_until_next_change(self, card_type: str, now: datetime,
+                                   start_time: str = None, end_time: str = None) -> int:
+        """
+        返回距离卡片显示内容下次变化的秒数
+
+        卡片数值按整分钟计算，百分比与当前值按显示精度求出下次变化所在的分钟。
+        """
+        minute_of_day = now.hour * 60 + now.minute
+        if card_type == "time":
+            minutes = self._minutes_until_time_card_change(minute_of_day, start_time, end_time)
+        elif card_type == "week":
+            minutes = self._minutes_until_day_card_change(now.weekday() + 1, 7, minute_of_day)
+        elif card_type == "month":
+            total_days = calendar.monthrange(now.year, now.month)[1]
+            minutes = self._minutes_until_day_card_change(now.day, total_days, minute_of_day)
+        else:
+            total_days = 366 if calendar.isleap(now.year) else 365
+            minutes = self._minutes_until_day_card_change(now.timetuple().tm_yday, total_days, minute_of_day)
+
+        seconds_into_minute = now.second + now.microsecond / 1_000_000
+        return max(1, math.ceil(minutes * 60 - seconds_into_minute))
+
+    def _card_etag(self, card_type: str, data: dict) -> str:
+        """由卡片上显示的字段计算 ETag，显示内容不变时 ETag 不变"""
+        displayed = (
+            card_type,
+            data['title'],
+            f"{data['percentage']:.1f}",
+            data['current'],
+            data['total'],
+            data['unit'],
+            data.get('day_of_year'),
+        )
+        digest = hashlib.sha1(repr(displayed).encode("utf-8")).hexdigest()
+        # 不同质量档位的图片内容等价，使用弱 ETag
+        return f'W/"{digest}"'
+
+    async def _start_http_service(self):
+        """启动仅监听本机的 HTTP 渲染服务"""
+        config = self.context.get_config()
+        port = int(config.get("http_service_port", 6196))
+
+        app = web.Application()
+        app.router.add_get("/render", self._handle_render_request)
+
+        self._http_runner = web.AppRunner(app, keepalive_timeout=75)
+        await self._http_runner.setup()
+        site = web.TCPSite(self._http_runner, "127.0.0.1", port)
+        await site.start()
+        logger.info(f"时间卡片 HTTP 渲染服务已启动: http://127.0.0.1:{port}/render")
+
+    async def _stop_http_service(self):
+        """停止 HTTP 渲染服务"""
+        if self._http_runner is not None:
+            await self._http_runner.cleanup()
+            self._http_runner = None
+
+    async def _handle_render_request(self, request: web.Request) -> web.Response:
+        """
+        处理渲染请求
+
+        用法:
+            GET /render?type=year - 渲染本年卡片
+            GET /render?type=time&start=14:00&end=21:00 - 渲染自定义时间段卡片
+            GET /render?type=countdown&start=2026-09-01&end=2027-01-15&title=学期 - 渲染任意时间段卡片
+        """
+        card_type = request.query.get("type", "time")
+        start_time = request.query.get("start")
+        end_time = request.query.get("end")
+
+        if card_type not in CARD_TYPES:
+            return web.json_response(
+                {"error": f"type 必须是 {', '.join(CARD_TYPES)} 之一"}, status=400
+            )
+
+        now, _ = self._get_current_time()
+        try:
+            if card_type == "countdown":
+                start = self.parse_datetime_string(start_time or "")
+                end = self.parse_datetime_string(end_time or "")
+                if not start or not end or end <= start:
+                    raise ValueError("start 和 end 必须是 ISO 格式的日期时间，且 end 晚于 start")
+                title = request.query.get("title", "倒计时")
+                if len(title) > MAX_TITLE_LENGTH:
+                    raise ValueError(f"title 不能超过 {MAX_TITLE_LENGTH} 个字符")
+                [(data, next_change)] = self.calculate_period_batch([(title, start, end)], now)
+                # 已结束的时间段显示内容不再变化
+                max_age = (
+                    max(1, math.ceil((next_change - now).total_seconds()))
+                    if next_change else 86400
+                )
+            else:
+                data = self.get_card_data(card_type, start_time, end_time, now)
+                max_age = self._seconds_until_next_change(card_type, now, start_time, end_time)
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+
+        headers = {
+            "ETag": self._card_etag(card_type, data),
+            "Cache-Control": f"public, max-age={max_age}",
+        }
+
+        if request.headers.get("If-None-Match") == headers["ETag"]:
+            return web.Response(status=304, headers=headers)
+
+        try:
+            image_bytes, quality = await self.render_card_bytes(card_type, data)
+        except Exception as e:
+            logger.error(f"HTTP 渲染请求失败: {e}")
+            return web.json_response({"error": str(e)}, status=500)
+
+        headers["X-Render-Quality"] = (
+            f"tier={quality['tier']}; scale={quality['scale']}; format={quality['format']}"
+        )
+        return web.Response(body=image_bytes, content_type=f"image/{quality['format']}", headers=headers)
+
     @filter.command("time")
     async def time_progress(self, event: AstrMessageEvent):
         """
@@ -787,3 +1506,203 @@ class TimeProgressPlugin(Star):
         except Exception as e:
             logger.error(f"处理本年进度指令失败: {e}")
             yield event.plain_result(f"❌ 生成本年卡片失败: {str(e)}")
+
+    def _load_countdowns(self) -> dict:
+        """读取已保存的倒计时，结构为 {会话: {名称: {"start": ISO, "end": ISO, "creator": 用户 ID}}}"""
+        try:
+            with open(self._countdowns_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.error(f"读取倒计时配置失败: {e}")
+            return {}
+
+    def _save_countdowns(self):
+        """保存倒计时并通知预渲染任务重新计算"""
+        temp_path = self._countdowns_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self._countdowns, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self._countdowns_path)
+        self._countdowns_changed.set()
+
+    def _countdown_periods(self, entries: dict) -> list:
+        """将保存的倒计时转为 calculate_period_batch 的输入"""
+        periods = []
+        for name, entry in entries.items():
+            start = self.parse_datetime_string(entry["start"])
+            end = self.parse_datetime_string(entry["end"])
+            if start and end:
+                periods.append((name, start, end))
+        return periods
+
+    def _can_modify_countdown(self, event: AstrMessageEvent, entry: dict) -> bool:
+        """倒计时只能由创建者或管理员修改、删除"""
+        return event.is_admin() or entry.get("creator") == event.get_sender_id()
+
+    async def _countdown_prerender_loop(self):
+        """在倒计时显示数值变化时预先渲染卡片到磁盘缓存"""
+        # 每个倒计时上次算出的下次变化时间，None 表示已结束且已渲染最终状态
+        next_changes = {}
+        while True:
+            # 先清除标记，渲染期间新增或删除的倒计时会在下一轮立即处理
+            self._countdowns_changed.clear()
+            try:
+                keys = []
+                periods = []
+                for session, entries in self._countdowns.items():
+                    for period in self._countdown_periods(entries):
+                        keys.append((session,) + period)
+                        periods.append(period)
+
+                now, _ = self._get_current_time()
+                results = self.calculate_period_batch(periods, now)
+
+                updated = {}
+                for key, (data, next_change) in zip(keys, results):
+                    # 新增的倒计时视为已到期，只渲染到达上次变化时间的倒计时
+                    previous = next_changes.get(key, now)
+                    if previous is not None and previous <= now:
+                        await self._render_card("time_card", data, track_load=False)
+                    updated[key] = next_change
+                next_changes = updated
+
+                delays = [
+                    (next_change - now).total_seconds()
+                    for next_change in next_changes.values() if next_change
+                ]
+                delay = min([COUNTDOWN_MAX_SLEEP] + delays)
+            except Exception as e:
+                logger.warning(f"预渲染倒计时卡片失败: {e}")
+                delay = COUNTDOWN_MAX_SLEEP
+
+            try:
+                await asyncio.wait_for(self._countdowns_changed.wait(), max(1, delay))
+            except asyncio.TimeoutError:
+                pass
+
+    @filter.command("countdown")
+    async def countdown_progress(self, event: AstrMessageEvent):
+        """
+        任意时间段的倒计时进度，每个会话单独保存
+
+        用法:
+            /countdown - 列出本会话的全部倒计时进度
+            /countdown 学期 - 显示指定倒计时的进度卡片
+            /countdown add 学期 2026-09-01 2027-01-15 - 添加倒计时
+            /countdown del 学期 - 删除倒计时（仅创建者或管理员）
+        """
+        usage = (
+            "用法：\n"
+            "  /countdown - 列出本会话的倒计时\n"
+            "  /countdown 名称 - 显示倒计时卡片\n"
+            "  /countdown add 名称 开始 结束 - 添加倒计时（如 2026-09-01 或 2026-09-01T08:00）\n"
+            "  /countdown del 名称 - 删除倒计时"
+        )
+        try:
+            parts = event.message_str.strip().split()
+            session = event.unified_msg_origin
+            entries = self._countdowns.get(session, {})
+
+            if len(parts) == 5 and parts[1] == "add":
+                name = parts[2]
+                if len(name) > MAX_TITLE_LENGTH:
+                    yield event.plain_result(f"❌ 倒计时名称不能超过 {MAX_TITLE_LENGTH} 个字符")
+                    return
+                start = self.parse_datetime_string(parts[3])
+                end = self.parse_datetime_string(parts[4])
+                if not start or not end:
+                    yield event.plain_result("❌ 时间格式错误，请使用 2026-09-01 或 2026-09-01T08:00 格式")
+                    return
+                if end <= start:
+                    yield event.plain_result("❌ 结束时间必须晚于开始时间")
+                    return
+                if name in entries:
+                    if not self._can_modify_countdown(event, entries[name]):
+                        yield event.plain_result(f"❌ 只有创建者或管理员可以修改倒计时 {name}")
+                        return
+                else:
+                    limit = int(self.context.get_config().get("max_countdowns_per_session", 10))
+                    if len(entries) >= limit:
+                        yield event.plain_result(f"❌ 每个会话最多保存 {limit} 个倒计时")
+                        return
+                self._countdowns.setdefault(session, {})[name] = {
+                    "start": start.isoformat(),
+                    "end": end.isoformat(),
+                    "creator": event.get_sender_id(),
+                }
+                self._save_countdowns()
+                yield event.plain_result(f"✅ 已添加倒计时 {name}")
+
+            elif len(parts) == 3 and parts[1] == "del":
+                name = parts[2]
+                if name not in entries:
+                    yield event.plain_result(f"❌ 倒计时 {name} 不存在")
+                    return
+                if not self._can_modify_countdown(event, entries[name]):
+                    yield event.plain_result(f"❌ 只有创建者或管理员可以删除倒计时 {name}")
+                    return
+                del entries[name]
+                if not entries:
+                    self._countdowns.pop(session, None)
+                self._save_countdowns()
+                yield event.plain_result(f"✅ 已删除倒计时 {name}")
+
+            elif len(parts) == 2:
+                name = parts[1]
+                if name not in entries:
+                    yield event.plain_result(f"❌ 倒计时 {name} 不存在\n" + usage)
+                    return
+                [(data, _)] = self.calculate_period_batch(
+                    self._countdown_periods({name: entries[name]})
+                )
+                image_path = await self.draw_time_card(data)
+                yield event.image_result(image_path)
+                try:
+                    os.unlink(image_path)
+                except:
+                    pass
+
+            elif len(parts) == 1:
+                if not entries:
+                    yield event.plain_result("当前会话没有倒计时\n" + usage)
+                    return
+                results = self.calculate_period_batch(self._countdown_periods(entries))
+                lines = [
+                    f"{data['title']}: {data['percentage']:.1f}% "
+                    f"({data['current']}/{data['total']} {data['unit']})"
+                    for data, _ in results
+                ]
+                yield event.plain_result("\n".join(lines))
+
+            else:
+                yield event.plain_result("❌ 参数错误\n" + usage)
+
+        except Exception as e:
+            logger.error(f"处理倒计时指令失败: {e}")
+            yield event.plain_result(f"❌ 处理倒计时失败: {str(e)}")
+
+    async def initialize(self):
+        """插件初始化，启动磁盘缓存清理和倒计时预渲染任务，并按配置启动 HTTP 渲染服务"""
+        config = self.context.get_config()
+        if config.get("disk_cache_enabled", True):
+            self._cache_evict_task = asyncio.create_task(self._disk_cache_evict_loop())
+            if config.get("countdown_prerender", False):
+                self._countdown_task = asyncio.create_task(self._countdown_prerender_loop())
+        if config.get("http_service_enabled", False):
+            try:
+                await self._start_http_service()
+            except Exception as e:
+                logger.error(f"启动 HTTP 渲染服务失败: {e}")
+
+    async def terminate(self):
+        """插件卸载时停止后台任务、HTTP 服务并释放浏览器资源"""
+        if self._cache_evict_task is not None:
+            self._cache_evict_task.cancel()
+            self._cache_evict_task = None
+        if self._countdown_task is not None:
+            self._countdown_task.cancel()
+            self._countdown_task = None
+        await self._stop_http_service()
+        await self._close_browser()
+        logger.info("时间进度卡片插件已卸载")
@@ -0,0 +1,102 @@
+"""
+测试公共配置
+
+基准图回归测试使用真实的 Playwright Chromium 渲染。浏览器不可用时本地跳过，
+在 CI（设置了 CI 环境变量）中且已有基准图时判定为失败。
+设置 TIMEPROGRESS_BROWSER_ENDPOINT 可通过 CDP 连接已启动的浏览器，与插件的 browser_endpoint 配置相同。
+更新基准图: python -m pytest tests --update-goldens
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GOLDEN_DIR = os.path.join(PLUGIN_DIR, "tests", "golden")
+sys.path.insert(0, PLUGIN_DIR)
+
+import main  # noqa: E402
+
+# 各用例的渲染耗时(毫秒)，在测试结束时汇总输出
+render_timings_key = pytest.StashKey[dict]()
+
+
+class FakeContext:
+    """只提供插件用到的 get_config 的最小 Context"""
+
+    def __init__(self, config: dict):
+        self._config = config
+
+    def get_config(self):
+        return self._config
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--update-goldens",
+        action="store_true",
+        default=False,
+        help="用本次渲染结果覆盖 tests/golden 下的基准图",
+    )
+
+
+def pytest_configure(config):
+    config.stash[render_timings_key] = {}
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    timings = config.stash.get(render_timings_key, {})
+    if not timings:
+        return
+    terminalreporter.section("卡片渲染耗时")
+    for name, render_ms in timings.items():
+        terminalreporter.write_line(f"{name}: {render_ms:.0f}ms")
+
+
+@pytest.fixture(scope="session")
+def update_goldens(request):
+    return request.config.getoption("--update-goldens")
+
+
+@pytest.fixture(scope="session")
+def render_timings(request):
+    return request.config.stash[render_timings_key]
+
+
+@pytest.fixture(scope="session")
+def event_loop_session():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+def plugin(tmp_path_factory, event_loop_session):
+    """关闭磁盘缓存和自适应质量的插件实例，数据目录指向临时目录"""
+    data_dir = tmp_path_factory.mktemp("plugin_data")
+    patcher = pytest.MonkeyPatch()
+    patcher.setattr(main.StarTools, "get_data_dir", staticmethod(lambda *args, **kwargs: data_dir))
+
+    instance = main.TimeProgressPlugin(FakeContext({
+        "timezone": "Asia/Shanghai",
+        "disk_cache_enabled": False,
+        "adaptive_quality": False,
+        "browser_endpoint": os.environ.get("TIMEPROGRESS_BROWSER_ENDPOINT", ""),
+    }))
+    try:
+        event_loop_session.run_until_complete(instance._get_browser())
+    except Exception as e:
+        patcher.undo()
+        has_goldens = os.path.isdir(GOLDEN_DIR) and any(
+            name.endswith(".png") for name in os.listdir(GOLDEN_DIR)
+        )
+        if os.environ.get("CI") and has_goldens:
+            pytest.fail(f"CI 中 Playwright Chromium 不可用，无法与基准图对比: {e}")
+        pytest.skip(f"Playwright Chromium 不可用: {e}")
+
+    yield instance
+
+    event_loop_session.run_until_complete(instance.terminate())
+    patcher.undo()
@@ -0,0 +1,134 @@
+"""
+卡片渲染基准图回归测试
+
+在固定时间下渲染每种卡片，与 tests/golden 下保存的基准图做感知对比，
+用于验证渲染路径的优化（页面复用、等待策略、缩放倍数、字体等）没有改变卡片外观。
+
+tests/golden 中的基准图由优化前的渲染路径（每次启动浏览器、固定缩放倍数、PNG、等待 500ms）生成，
+渲染环境为 chrome-headless-shell 141.0.7390.54，仅安装 Lato 与 Source Code Pro 字体、
+插件字体文件不存在，中文字符显示为缺字方框。在其他字体环境下运行需先在该环境重新生成基准图。
+"""
+
+import io
+import os
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+from PIL import Image, ImageChops, ImageFilter
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+
+# 模糊后灰度差超过该值的像素视为不同
+GOLDEN_PIXEL_TOLERANCE = 16
+# 不同像素占比超过该值判定为回归
+GOLDEN_DIFF_THRESHOLD = 0.001
+
+# 倒计时卡片的标题来自用户输入，含需要转义的字符
+COUNTDOWN_TITLE = "Finals & 期末"
+
+# (名称, 卡片类型, 开始时间, 结束时间, 固定时间)
+GOLDEN_CASES = [
+    ("time_0000", "time", None, None, datetime(2024, 3, 10, 0, 0)),
+    ("time_2359", "time", None, None, datetime(2024, 3, 10, 23, 59)),
+    ("time_0800_2400", "time", "08:00", "24:00", datetime(2024, 3, 10, 12, 0)),
+    ("time_0000_2400_end", "time", "00:00", "24:00", datetime(2024, 3, 10, 23, 59)),
+    ("time_overnight_before_midnight", "time", "22:00", "02:00", datetime(2024, 3, 10, 23, 30)),
+    ("time_overnight_after_midnight", "time", "22:00", "02:00", datetime(2024, 3, 11, 1, 0)),
+    ("time_overnight_outside", "time", "22:00", "02:00", datetime(2024, 3, 10, 12, 0)),
+    ("week_monday_0000", "week", None, None, datetime(2024, 3, 11, 0, 0)),
+    ("week_sunday_2359", "week", None, None, datetime(2024, 3, 17, 23, 59)),
+    ("month_leap_feb29", "month", None, None, datetime(2024, 2, 29, 12, 0)),
+    ("month_dec31", "month", None, None, datetime(2023, 12, 31, 23, 59)),
+    ("year_jan1_0000", "year", None, None, datetime(2024, 1, 1, 0, 0)),
+    ("year_dec31", "year", None, None, datetime(2023, 12, 31, 23, 59)),
+    ("year_leap_dec31", "year", None, None, datetime(2024, 12, 31, 23, 59)),
+    ("year_matrix_jan1_0000", "year_matrix", None, None, datetime(2024, 1, 1, 0, 0)),
+    ("year_matrix_dec31", "year_matrix", None, None, datetime(2023, 12, 31, 12, 0)),
+    ("year_matrix_leap_dec31", "year_matrix", None, None, datetime(2024, 12, 31, 23, 59)),
+    ("countdown_semester", "countdown", "2026-09-01", "2027-01-15",
+     datetime(2026, 11, 1, 12, 0, tzinfo=ZoneInfo("Asia/Shanghai"))),
+]
+
+
+def card_data(plugin, case) -> dict:
+    """按用例计算卡片数据"""
+    _, card_type, start_time, end_time, now = case
+    if card_type == "countdown":
+        start = plugin.parse_datetime_string(start_time)
+        end = plugin.parse_datetime_string(end_time)
+        [(data, _)] = plugin.calculate_period_batch([(COUNTDOWN_TITLE, start, end)], now)
+        return data
+    return plugin.get_card_data(card_type, start_time, end_time, now)
+
+
+def golden_diff_ratio(golden_path: str, image_bytes: bytes) -> float:
+    """
+    计算渲染结果与基准图的感知差异
+
+    两张图转为灰度并轻微模糊以忽略抗锯齿差异，尺寸不同时（如修改了缩放倍数）
+    先缩放到基准图尺寸，返回灰度差超过容差的像素占比。
+    """
+    with Image.open(golden_path) as golden_img:
+        golden = golden_img.convert("L")
+    with Image.open(io.BytesIO(image_bytes)) as candidate_img:
+        candidate = candidate_img.convert("L")
+    if candidate.size != golden.size:
+        candidate = candidate.resize(golden.size, Image.LANCZOS)
+
+    golden = golden.filter(ImageFilter.GaussianBlur(1))
+    candidate = candidate.filter(ImageFilter.GaussianBlur(1))
+    diff = ImageChops.difference(golden, candidate)
+    changed = diff.point(lambda v: 255 if v > GOLDEN_PIXEL_TOLERANCE else 0).histogram()[255]
+    return changed / (golden.size[0] * golden.size[1])
+
+
+@pytest.mark.parametrize("case", GOLDEN_CASES, ids=[case[0] for case in GOLDEN_CASES])
+def test_card_matches_golden(plugin, event_loop_session, update_goldens, render_timings,
+                             record_property, case):
+    name, card_type = case[0], case[1]
+    data = card_data(plugin, case)
+    layout = "year_matrix" if card_type == "year_matrix" else "time_card"
+
+    started = time.perf_counter()
+    image_bytes, _ = event_loop_session.run_until_complete(
+        plugin._render_card(layout, data, fresh=True)
+    )
+    render_ms = (time.perf_counter() - started) * 1000
+    render_timings[name] = render_ms
+    record_property("render_ms", round(render_ms, 1))
+
+    golden_path = os.path.join(GOLDEN_DIR, f"{name}.png")
+    if update_goldens:
+        os.makedirs(GOLDEN_DIR, exist_ok=True)
+        with open(golden_path, "wb") as f:
+            f.write(image_bytes)
+        return
+
+    if not os.path.exists(golden_path):
+        pytest.fail(f"缺少基准图 {golden_path}，请运行 python -m pytest tests --update-goldens 生成")
+
+    diff = golden_diff_ratio(golden_path, image_bytes)
+    record_property("diff", diff)
+    assert diff <= GOLDEN_DIFF_THRESHOLD, f"{name} 与基准图差异 {diff * 100:.3f}%"
+
+
+def test_golden_diff_detects_changes(tmp_path):
+    """对比函数本身：相同图片无差异，缩放倍数不同视为相同，进度条变化被检出"""
+    def card(bar_width: int, scale: int = 1) -> Image.Image:
+        img = Image.new("RGB", (420 * scale, 240 * scale), "white")
+        img.paste((39, 39, 42), (32 * scale, 60 * scale, (32 + bar_width) * scale, 92 * scale))
+        return img
+
+    def png(img: Image.Image) -> bytes:
+        buffer = io.BytesIO()
+        img.save(buffer, "PNG")
+        return buffer.getvalue()
+
+    golden_path = tmp_path / "golden.png"
+    card(178, scale=2).save(golden_path)
+
+    assert golden_diff_ratio(str(golden_path), png(card(178, scale=2))) == 0
+    assert golden_diff_ratio(str(golden_path), png(card(178, scale=1))) <= GOLDEN_DIFF_THRESHOLD
+    assert golden_diff_ratio(str(golden_path), png(card(188, scale=2))) > GOLDEN_DIFF_THRESHOLD